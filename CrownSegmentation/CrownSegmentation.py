@@ -1,23 +1,31 @@
 import os
-import glob
 import vtk, qt, slicer
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin, pip_install
 from enum import Enum
-import subprocess
 import platform
 
 from CondaSetUp import  CondaSetUpCall,CondaSetUpCallWsl
 
-import webbrowser
-import csv
 import io
-import time
 import threading
+import concurrent.futures
 import sys
+import logging
 
 from pathlib import Path
 import re
+import shlex
+import socket
+
+logger = logging.getLogger(__name__)
+
+_WSL_CONDA_SETTING = "TeethSeg_WslConda" # conda executable and folder that passed conda --version in wsl, and its version
+_WSL_REQUIRED_LIBS = ("libxrender1","libgl1-mesa-glx") # checked by check_lib_wsl
+_DPKG_INSTALLED_RE = re.compile(r"^[hi]i\s+([^\s:]+)", re.M) # package name of the installed (ii) or held (hi) lines of dpkg -l, without :arch
+_WIN2LIN_TABLE = str.maketrans({'\\': '/'}) # used by windows_to_linux_path
+_EXTS = ('.vtk','.stl') # surface files the segmentation accepts
+_CSV_SPECIAL_CHARS = (',', '"', '\n', '\r') # paths with one of them are written with csv.writer in create_csv
 #
 # CrownSegmentation
 #
@@ -57,6 +65,37 @@ def func_import(install=False):
     return False
     
 
+def walk_fast(root,extensions):
+  '''
+  Yield the path of the files under root whose name ends with one of extensions.
+  Same files as os.walk (links to folders are not followed, folders that cannot be read are skipped),
+  but the type of each entry comes from the directory read of os.scandir instead of a stat() per entry.
+  '''
+  stack = []
+  def scan(path):
+    try:
+      stack.append(os.scandir(path))
+    except OSError:
+      pass
+
+  scan(root)
+  try:
+    while stack:
+      try:
+        entry = next(stack[-1], None)
+      except OSError:
+        entry = None
+      if entry is None:
+        stack.pop().close()
+      elif entry.is_dir(follow_symlinks=False):
+        scan(entry.path)
+      elif entry.name.endswith(extensions):
+        yield entry.path
+  finally:
+    for entries in stack:
+      entries.close()
+
+
 class CrownSegmentation(ScriptedLoadableModule):
   """Uses ScriptedLoadableModule base class, available at:
   https://github.com/Slicer/Slicer/blob/master/Base/Python/slicer/ScriptedLoadableModule.py
@@ -144,11 +183,8 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
 
     self.logic = None
     self._parameterNode = None
-    self._updatingGUIFromParameterNode = False
     self.fileName = ""
     self.input = ""
-    self.outputFolder = ""
-    self.output  = ""
     self.lArrays = []
     self.model = "" 
     self.nbFiles = 1
@@ -158,12 +194,23 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     self.inputChoice = InputChoice.VTK
     self.lNodes = []
     self.MRMLNode = None
-    self.log_path = os.path.join(slicer.util.tempDirectory(), 'process.log')
+    self.temp_folder = slicer.util.tempDirectory()
+    self.log_path = os.path.join(self.temp_folder, 'process.log')
+    # list of the input files when the input is a folder, in the temp folder as the module folder may be read-only
+    self.list_file_csv = os.path.join(self.temp_folder, "list_file.csv")
+    self._temp_files = [] # intermediate files of the current run, removed by removeTempFiles
     self.time_log = 0 # for progress bar
     self.progress = 0
     self.currentPredDict = {}
-    self.previous_time = 0
-    self.start_time = 0
+    self.elapsed_timer = qt.QElapsedTimer() # time of the segmentation
+    self._label_timer = qt.QTimer() # refreshes timeLabel while the CLI runs
+    self._label_timer.setInterval(300)
+    self._label_timer.timeout.connect(self._tickLabel)
+    self._io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2) # input files preparation
+    self._env_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) # wsl checks, one at a time as they share self.conda_wsl
+    self._env_lock = threading.RLock() # guards the cached wsl checks and self.conda_wsl
+    self.conda_wsl = None
+    self._resetEnvironmentCache(forget_saved=False)
 
 
   def setup(self):
@@ -197,19 +244,20 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
 
     # UI elements
     
-    self.ui.dependenciesButton.connect('clicked(bool)',self.checkDependencies)
+    self.ui.dependenciesButton.clicked.connect(self.checkDependencies)
+    self.ui.recheckEnvironmentButton.clicked.connect(self.onRecheckEnvironment)
 
     # Inputs
-    self.ui.applyChangesButton.connect('clicked(bool)',self.onApplyChangesButton)
+    self.ui.applyChangesButton.clicked.connect(self.onApplyChangesButton)
     self.ui.rotationSpinBox.valueChanged.connect(self.onRotationSpinbox)
     self.ui.rotationSlider.valueChanged.connect(self.onRotationSlider)
-    self.ui.browseSurfaceButton.connect('clicked(bool)',self.onBrowseSurfaceButton)
-    self.ui.inputFolderPushButton.connect('clicked(bool)',self.onBrowseInputFolderButton)
-    self.ui.browseModelButton.connect('clicked(bool)',self.onBrowseModelButton)
+    self.ui.browseSurfaceButton.clicked.connect(self.onBrowseSurfaceButton)
+    self.ui.inputFolderPushButton.clicked.connect(self.onBrowseInputFolderButton)
+    self.ui.browseModelButton.clicked.connect(self.onBrowseModelButton)
     self.ui.surfaceLineEdit.textChanged.connect(self.onEditSurfaceLine)
     self.ui.inputFolderLineEdit.textChanged.connect(self.onEditInputFolderLine)
     self.ui.modelLineEdit.textChanged.connect(self.onEditModelLine)    
-    self.ui.githubButton.connect('clicked(bool)',self.onGithubButton)
+    self.ui.githubButton.clicked.connect(self.onGithubButton)
     self.ui.checkBoxLatestModel.stateChanged.connect(self.useLatestModel)
     self.ui.checkBoxOverwrite.stateChanged.connect(self.overwrite)
     self.ui.surfaceComboBox.currentTextChanged.connect(self.onSurfaceModeChanged)
@@ -228,13 +276,11 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     self.ui.labelComboBox.currentTextChanged.connect(self.onFDI)
 
     # Outputs 
-    self.ui.browseOutputButton.connect('clicked(bool)',self.onBrowseOutputButton)
-    self.ui.outputLineEdit.textChanged.connect(self.onEditOutputLine)
-    self.ui.outputFileLineEdit.textChanged.connect(self.onEditOutputLine)
-    self.ui.openOutSurfButton.connect('clicked(bool)',self.onOpenOutSurfButton)
-    self.ui.openOutFolderButton.connect('clicked(bool)',self.onOpenOutFolderButton)
-    self.ui.resetButton.connect('clicked(bool)',self.onReset)
-    self.ui.cancelButton.connect('clicked(bool)', self.onCancel)
+    self.ui.browseOutputButton.clicked.connect(self.onBrowseOutputButton)
+    self.ui.openOutSurfButton.clicked.connect(self.onOpenOutSurfButton)
+    self.ui.openOutFolderButton.clicked.connect(self.onOpenOutFolderButton)
+    self.ui.resetButton.clicked.connect(self.onReset)
+    self.ui.cancelButton.clicked.connect(self.onCancel)
     self.ui.progressLabel.setHidden(True)
     self.ui.openOutSurfButton.setHidden(True)
     self.ui.openOutFolderButton.setHidden(True)
@@ -243,15 +289,41 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     self.ui.githubButton.setHidden(True)
     self.ui.timeLabel.setHidden(True)
     self.ui.progressBar.setHidden(True)
+
+    # (visible, enabled) of the widgets for each stage of a run, None leaves it unchanged. See setUiState
+    stopped = {
+      self.ui.applyChangesButton: (None, True),
+      self.ui.resetButton: (None, True),
+      self.ui.progressLabel: (False, None),
+      self.ui.cancelButton: (None, False),
+      self.ui.progressBar: (False, False),
+    }
+    self._ui_states = {
+      'idle': {
+        self.ui.applyChangesButton: (None, True),
+        self.ui.progressLabel: (False, None),
+        self.ui.openOutSurfButton: (False, None),
+        self.ui.openOutFolderButton: (False, None),
+        self.ui.doneLabel: (False, None),
+      },
+      'running': {
+        self.ui.applyChangesButton: (None, False),
+        self.ui.doneLabel: (False, None),
+        self.ui.timeLabel: (True, None),
+        self.ui.progressLabel: (True, None),
+      },
+      'stopped': stopped, # error or cancel
+      'done': {**stopped, self.ui.doneLabel: (True, None)},
+    }
     
 
     #initialize variables
-    if qt.QSettings().value('TeethSeg_ModelPath') != None:
-      self.ui.modelLineEdit.setText(qt.QSettings().value('TeethSeg_ModelPath'))
+    settings = qt.QSettings()
+    modelPath = settings.value('TeethSeg_ModelPath')
+    if modelPath != None:
+      self.ui.modelLineEdit.setText(modelPath)
     self.model = self.ui.modelLineEdit.text
     self.input = self.ui.surfaceLineEdit.text
-    self.outputFolder = self.ui.outputLineEdit.text
-    self.output = self.ui.outputLineEdit.text + self.ui.outputFileLineEdit.text
     self.predictedId = self.ui.predictedIdLineEdit.text
     self.resolution = int(self.ui.resolutionComboBox.currentText)
     self.rotation = self.ui.rotationSlider.value
@@ -270,8 +342,15 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
 
 
 
+    # On Windows, start the wsl checks now so their results are cached when the user clicks Apply
+    if platform.system() == "Windows":
+      self.conda_wsl = CondaSetUpCallWsl()
+      self._env_executor.submit(self._checkWslEnv)
+    else:
+      self.ui.recheckEnvironmentButton.setHidden(True) # nothing is cached on linux
+
     # qt.QSettings().setValue("TeethSegVisited",None)
-    if qt.QSettings().value('TeethSegVisited') is None:
+    if settings.value('TeethSegVisited') is None:
         self.msg = qt.QMessageBox()
         self.msg.setText(f'Welcome to this module!\n'
           'The module works with Linux only. You also need a CUDA capable GPU.\n'
@@ -291,22 +370,18 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     """
     Called when the application closes and the module widget is destroyed.
     """
+    self._label_timer.stop()
+    self._io_executor.shutdown(wait=False, cancel_futures=True)
+    self._env_executor.shutdown(wait=False, cancel_futures=True)
     self.removeObservers()
 
   def enter(self):
     """
     Called each time the user opens this module.
     """
-    # Make sure parameter node exists and observed
+    # Make sure parameter node exists
     self.initializeParameterNode()
 
-  def exit(self):
-    """
-    Called each time the user opens a different module.
-    """
-    # Do not react to parameter node changes (GUI wlil be updated when the user enters into the module)
-    self.removeObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.updateGUIFromParameterNode)
-
   def onSceneStartClose(self, caller, event):
     """
     Called just before the scene is closed.
@@ -324,7 +399,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
 
   def initializeParameterNode(self):
     """
-    Ensure parameter node exists and observed.
+    Ensure parameter node exists.
     """
     # Parameter node stores all user choices in parameter values, node selections, etc.
     # so that when the scene is saved and reloaded, these settings are restored.
@@ -339,58 +414,11 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
 
   def setParameterNode(self, inputParameterNode):
     """
-    Set and observe parameter node.
-    Observation is needed because when the parameter node is changed then the GUI must be updated immediately.
+    Set parameter node.
+    No GUI element is synchronized with it, so it is not observed: observe it and update the GUI
+    (coalesced with a qt.QTimer) if some parameters are stored there.
     """
-
-    # if inputParameterNode:
-    #   self.logic.setDefaultParameters(inputParameterNode)
-
-    # Unobserve previously selected parameter node and add an observer to the newly selected.
-    # Changes of parameter node are observed so that whenever parameters are changed by a script or any other module
-    # those are reflected immediately in the GUI.
-    if self._parameterNode is not None:
-      self.removeObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.updateGUIFromParameterNode)
     self._parameterNode = inputParameterNode
-    if self._parameterNode is not None:
-      self.addObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.updateGUIFromParameterNode)
-
-    # Initial GUI update
-    self.updateGUIFromParameterNode()
-
-  def updateGUIFromParameterNode(self, caller=None, event=None):
-    """
-    This method is called whenever parameter node is changed.
-    The module GUI is updated to show the current state of the parameter node.
-    """
-
-    if self._parameterNode is None or self._updatingGUIFromParameterNode:
-      return
-
-    # Make sure GUI changes do not call updateParameterNodeFromGUI (it could cause infinite loop)
-    self._updatingGUIFromParameterNode = True
-
-
-    # All the GUI updates are done
-    self._updatingGUIFromParameterNode = False
-
-  def updateParameterNodeFromGUI(self, caller=None, event=None):
-    """
-    This method is called when the user makes any change in the GUI.
-    The changes are saved into the parameter node (so that they are restored when the scene is saved and loaded).
-    """
-
-    if self._parameterNode is None or self._updatingGUIFromParameterNode:
-      return
-
-    wasModified = self._parameterNode.StartModify()  # Modify all properties in a single batch
-
-
-    self._parameterNode.EndModify(wasModified)
-
-
-
-
 
   def onCBchecked(self):
     state = self.cb.checkState()
@@ -412,7 +440,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
       self.ui.surfaceLineEdit.setText(self.input)
 
     if self.ui.checkBoxOverwrite.checked :
-      self.ui.outputLineEdit.setText(os.path.dirname(self.ui.surfaceLineEdit.text))
+      self.ui.outputLineEdit.setText(os.path.dirname(self.input))
     #print(f'Surface directory : {self.surfaceFile}')
 
 
@@ -420,7 +448,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     newInputFolder = qt.QFileDialog.getExistingDirectory(self.parent, "Select a directory")
     if newInputFolder != '':
       self.input = newInputFolder
-      print(self.input)
+      logger.debug('input folder : %s',self.input)
       self.ui.inputFolderLineEdit.setText(self.input)
 
     if self.ui.checkBoxOverwrite.checked :
@@ -442,13 +470,10 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
       self.ui.outputFileLineEdit.setEnabled(False)
       self.ui.outputLineEdit.setEnabled(False)
       self.ui.outputFileLineEdit.setText("None")
-      print(self.ui.surfaceLineEdit.text)
-      print(self.ui.surfaceComboBox.currentText)
       if self.ui.surfaceComboBox.currentText=="Select file":
         self.ui.outputLineEdit.setText(os.path.dirname(self.ui.surfaceLineEdit.text))
       else : 
         self.ui.outputLineEdit.setText(self.ui.inputFolderLineEdit.text)
-        print(self.ui.inputFolderLineEdit.text)
 
 
     else : 
@@ -472,6 +497,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     # webbrowser.open('https://github.com/MathieuLeclercq/fly-by-cnn/blob/master/src/py/FiboSeg/best_metric_model_segmentation2d_array_v2_5.pth')
     # webbrowser.open('https://github.com/MathieuLeclercq/fly-by-cnn/blob/master/src/py/challenge-teeth/checkpoints/07-21-22_val-loss0.169.pth')
     # webbrowser.open('https://github.com/DCBIA-OrthoLab/SlicerDentalModelSeg/releases/tag/v3.0')
+    import webbrowser
     webbrowser.open('https://github.com/DCBIA-OrthoLab/Fly-by-CNN/releases/tag/3.0')
 
 
@@ -532,16 +558,19 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
   def onNodeChanged(self):
     self.MRMLNode = slicer.mrmlScene.GetNodeByID(self.ui.MRMLNodeComboBox.currentNodeID)
     if self.MRMLNode is not None:
-      print(self.MRMLNode.GetName())
+      logger.debug('MRML node : %s',self.MRMLNode.GetName())
 
 
   def writeVTKFromNode(self):
     poly = self.MRMLNode.GetPolyData()    
-    filename = self.output[0:-4]+"_input.vtk"
-    print(filename)
+    # intermediate file only read by the CLI, keep it in Slicer's temporary folder and not in the output folder
+    filename = os.path.join(self.temp_folder, os.path.basename(self.output[0:-4])+"_input.vtk")
+    self._temp_files.append(filename)
+    logger.debug('input vtk : %s',filename)
     polydatawriter = vtk.vtkPolyDataWriter()
     polydatawriter.SetFileName(filename)
     polydatawriter.SetInputData(poly)
+    polydatawriter.SetFileTypeToBinary() # ASCII is several times bigger and slower to write and parse
     polydatawriter.Write()
     return filename
 
@@ -558,6 +587,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     self.resolution = int(self.ui.resolutionComboBox.currentText)
 
   def checkDependencies(self): #TODO: ALSO CHECK FOR CUDA 
+    self._env_executor.submit(self._resetEnvironmentCache)
     self.ui.dependenciesButton.setEnabled(False)
     self.ui.applyChangesButton.setEnabled(False)
     self.ui.installProgressBar.setEnabled(True)
@@ -590,7 +620,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
 
   def onFDI(self):
     self.chooseFDI = self.ui.labelComboBox.currentIndex
-    print(f'chooseFDI: {self.chooseFDI}')
+    logger.debug('chooseFDI : %s',self.chooseFDI)
 
 
 
@@ -606,37 +636,134 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
     jaw_model.GetDisplayNode().SetScalarVisibility(True)
 
   def onOpenOutFolderButton(self):
+    import webbrowser
     webbrowser.open(self.output)
 
   def onBrowseOutputButton(self):
     newoutputFolder = qt.QFileDialog.getExistingDirectory(self.parent, "Select a directory")
     if newoutputFolder != '':
-      if newoutputFolder[-1] != "/":
-        newoutputFolder += '/'
-      self.outputFolder = newoutputFolder
-      print(self.outputFolder)
-      self.ui.outputLineEdit.setText(self.outputFolder)
-      print(self.output)
+      self.ui.outputLineEdit.setText(newoutputFolder)
+      logger.debug('output : %s',self.output)
     #print(f'Output directory : {self.output}')   
 
 
-  def onEditOutputLine(self): # called when either output folder line or output file line is modified
-    self.outputFolder = self.ui.outputLineEdit.text
-    self.output = self.ui.outputLineEdit.text + self.ui.outputFileLineEdit.text
+  # read from the line edits when needed instead of being updated on every keystroke
+  @property
+  def outputFolder(self):
+    return self.ui.outputLineEdit.text
+
+  @property
+  def output(self):
+    return os.path.join(self.ui.outputLineEdit.text, self.ui.outputFileLineEdit.text)
+
   ###
   ### PROCESS
   ###
 
+  def _resetEnvironmentCache(self,forget_saved=True):
+      '''
+      Forget the results of the wsl and conda probes, they are done again on the next run.
+      Only positive answers are kept, so a missing dependency is checked again once the user installed it.
+      forget_saved also forgets the conda check saved in the settings for the next sessions.
+      '''
+      with self._env_lock:
+        if forget_saved:
+          qt.QSettings().remove(_WSL_CONDA_SETTING)
+        self._cached_conda_exe = None
+        self._cached_conda_path = None
+        self._cached_env_ok = {}
+        self._wsl_ok = False
+        self._libs_ok = False
+        self._conda_ok = False
+
+  def _wslAvailable(self)->bool:
+      if not self._wsl_ok:
+        self._wsl_ok = self.conda_wsl.testWslAvailable()
+      return self._wsl_ok
+
+  def _condaAvailable(self)->bool:
+      if self._conda_ok:
+        return True
+      conda_exe = self._condaExecutable()
+      # skip conda --version if it already passed with this executable, in this session or a previous one
+      # run in self._io_executor too, so use a QSettings of this thread
+      # the saved check is only valid for the same executable in the same conda folder
+      settings = qt.QSettings()
+      conda_path = self._condaPath()
+      self._conda_ok = (settings.value(_WSL_CONDA_SETTING+"/executable") == conda_exe
+                        and settings.value(_WSL_CONDA_SETTING+"/path") == conda_path)
+      if not self._conda_ok:
+        settings.remove(_WSL_CONDA_SETTING)
+        output = self.conda_wsl.condaRunCommand([conda_exe,"--version"])
+        self._conda_ok = "Error" not in output
+        if self._conda_ok:
+          settings.setValue(_WSL_CONDA_SETTING+"/executable",conda_exe)
+          settings.setValue(_WSL_CONDA_SETTING+"/path",conda_path)
+          settings.setValue(_WSL_CONDA_SETTING+"/version",output.strip())
+      return self._conda_ok
+
+  def _checkWslEnv(self):
+      '''
+      Return (wsl, lib, conda, env): wsl available, required libraries installed in it, conda working and environment shapeaxi existing.
+      The checks are done one after the other and a check is skipped when the one it depends on failed.
+      Run in self._env_executor, self._env_lock keeps the main thread out of the caches and self.conda_wsl meanwhile.
+      '''
+      with self._env_lock:
+        try:
+          wsl = self._wslAvailable()
+          lib = wsl and self.check_lib_wsl()
+          conda = lib and self._condaAvailable()
+          env = conda and self._envExists('shapeaxi')
+        except Exception:
+          self._resetEnvironmentCache()
+          raise
+      return wsl, lib, conda, env
+
+  def onRecheckEnvironment(self):
+      '''
+      Forget the cached and saved wsl checks, then check again in the background.
+      For the user to call after installing or removing wsl, miniconda or the environment.
+      '''
+      self._env_executor.submit(self._resetEnvironmentCache)
+      if self.conda_wsl is not None:
+        self._env_executor.submit(self._checkWslEnv)
+
+  def _condaExecutable(self):
+      '''
+      Conda executable in wsl, asked to CondaSetUp only once
+      '''
+      with self._env_lock:
+        if self._cached_conda_exe is None:
+          self._cached_conda_exe = self.conda_wsl.getCondaExecutable()
+        return self._cached_conda_exe
+
+  def _condaPath(self):
+      '''
+      Conda folder in wsl, asked to CondaSetUp only once
+      '''
+      with self._env_lock:
+        if self._cached_conda_path is None:
+          self._cached_conda_path = self.conda_wsl.getCondaPath()
+        return self._cached_conda_path
+
+  def _envExists(self,name_env)->bool:
+      '''
+      Check if the environment name_env exists in wsl, a positive answer is kept until checkDependencies
+      '''
+      if not self._cached_env_ok.get(name_env):
+        self._cached_env_ok[name_env] = self.conda_wsl.condaTestEnv(name_env)
+      return self._cached_env_ok[name_env]
+
   def check_pythonpath_windows(self,name_env,file):
       '''
       Check if the environment env_name in wsl know the path to a specific file (ex : Crownsegmentationcli.py)
       return : bool
       '''
-      conda_exe = self.conda_wsl.getCondaExecutable()
+      conda_exe = self._condaExecutable()
       command = [conda_exe, "run", "-n", name_env, "python" ,"-c", f"\"import {file} as check;import os; print(os.path.isfile(check.__file__))\""]
-      print("command : ",command)
+      logger.debug("command : %s",command)
       result = self.conda_wsl.condaRunCommand(command)
-      print("result = ",result)
+      logger.debug("result = %s",result)
       if "True" in result :
           return True
       return False
@@ -650,10 +777,10 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
       for path in paths :
           mnt_paths.append(f"\"{self.windows_to_linux_path(path)}\"")
       pythonpath_arg = 'PYTHONPATH=' + ':'.join(mnt_paths)
-      conda_exe = self.conda_wsl.getCondaExecutable()
+      conda_exe = self._condaExecutable()
       # print("Conda_exe : ",conda_exe)
       argument = [conda_exe, 'env', 'config', 'vars', 'set', '-n', name_env, pythonpath_arg]
-      print("arguments : ",argument)
+      logger.debug("arguments : %s",argument)
       self.conda_wsl.condaRunCommand(argument)
 
 
@@ -669,21 +796,25 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
                         - run the file CrownSegmentationcli.py into wsl in the environment 'shapeaxi'
     '''
     self.ui.applyChangesButton.setEnabled(False)
+    # stat each path once, the branches below only use these results
+    out_ok = os.path.isdir(self.outputFolder)
+    model_ok = self.model=="latest" or os.path.isfile(self.model)
+    in_file = os.path.isfile(self.input)
+    in_dir = not in_file and os.path.isdir(self.input)
     #if ((self.inputChoice is InputChoice.MRML_NODE and self.MRMLNode is not None) or os.path.isfile(self.input) or os.path.isdir(self.input))  and os.path.isdir(self.outputFolder) and os.path.isfile(self.model):
-    if not(os.path.isdir(self.outputFolder) and (os.path.isfile(self.model) or self.model=="latest")):
-      print('Error.')
+    if not(out_ok and model_ok):
       msg = qt.QMessageBox()
-      if not(os.path.isdir(self.outputFolder)):
+      if not out_ok:
         msg.setText("Output directory : \nIncorrect path.")
-        print('Error: Incorrect path for output directory.')
+        logger.error('Incorrect path for output directory.')
         self.ui.outputLineEdit.setText('')
-        print(f'output folder : {self.outputFolder}')
+        logger.debug('output folder : %s',self.outputFolder)
 
-      elif (not(os.path.isfile(self.model)) and self.model!="latest"):
+      elif not model_ok:
         msg.setText("Model : \nIncorrect path.")
-        print('Error: Incorrect path for model.')
+        logger.error('Incorrect path for model.')
         self.ui.modelLineEdit.setText('')
-        print(f'model path: {self.model}')
+        logger.debug('model path: %s',self.model)
 
       else:
         msg.setText('Unknown error.')
@@ -692,20 +823,19 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
       msg.exec_()
       return
 
-    elif not((self.inputChoice is InputChoice.MRML_NODE and self.MRMLNode is not None) or os.path.isfile(self.input) or os.path.isdir(self.input)):
-      print('Error.')
+    elif not((self.inputChoice is InputChoice.MRML_NODE and self.MRMLNode is not None) or in_file or in_dir):
       msg = qt.QMessageBox()
-      if self.inputChoice is InputChoice.VTK and not(os.path.isfile(self.surfaceFile)):        
+      if self.inputChoice is InputChoice.VTK and not in_file:        
         msg.setText("Surface directory : \nIncorrect path.")
-        print('Error: Incorrect path for surface directory.')
+        logger.error('Incorrect path for surface directory.')
         self.ui.surfaceLineEdit.setText('')
-        print(f'surface folder : {self.surfaceFile}')
+        logger.debug('surface folder : %s',self.input)
 
       elif self.inputChoice is InputChoice.MRML_NODE and self.MRMLNode is None:        
         msg.setText("Input surface : \nPlease select a MRML node.")
-        print('Error: No MRML node was selected.')
+        logger.error('No MRML node was selected.')
         self.ui.surfaceLineEdit.setText('')
-        print(f'MRML node : {self.MRMLNode}')
+        logger.debug('MRML node : %s',self.MRMLNode)
 
       else:
         msg.setText('Unknown error.')
@@ -715,19 +845,10 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
       return
 
     else:
-        # create input parameters
-        surf = "None"
-        input_csv = "None"
-        vtk_folder = "None"
-        if os.path.isfile(self.input):
-            extension = os.path.splitext(self.input)[1]
-            if extension == ".vtk" or extension == ".stl":
-              surf = self.input
-              
-        elif os.path.isdir(self.input):
-          input_csv = self.create_csv()
-          vtk_folder = self.input
-
+        self.ui.recheckEnvironmentButton.setEnabled(False) # the checks below and the run use self.conda_wsl
+        # start the input files now, the csv of a folder is written while the environment is checked
+        inputs_future = self.prepareInputs(in_file,in_dir)
+        cli_running = False
         self.ui.timeLabel.setHidden(False)
         if platform.system() != "Windows" : #if linux system
             env_ok = func_import(False)
@@ -740,7 +861,10 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
             if env_ok : 
               slicer_path = slicer.app.applicationDirPath()
               dentalmodelseg_path = os.path.join(slicer_path,"..","lib","Python","bin","dentalmodelseg")
-              print("dentalmodelseg_path : ",dentalmodelseg_path)
+              logger.debug("dentalmodelseg_path : %s",dentalmodelseg_path)
+              inputs = self._waitInputs(inputs_future)
+            if env_ok and inputs is not None :
+              surf, input_csv, vtk_folder = inputs
               self.logic = CrownSegmentationLogic(surf,
                                               input_csv, 
                                               self.ui.outputLineEdit.text,
@@ -758,21 +882,20 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
               self.logic.process()
               self.addObserver(self.logic.cliNode,vtk.vtkCommand.ModifiedEvent,self.onProcessUpdate)
               self.onProcessStarted()
-              file_path = os.path.abspath(__file__)
-              folder_path = os.path.dirname(file_path)
+              cli_running = True # onProcessUpdate removes the input files when the CLI is done
               
         else : # if windows system
             # The code is run on wsl into an environment 'shapeaxi'
-            self.conda_wsl = CondaSetUpCallWsl()  
-            wsl = self.conda_wsl.testWslAvailable()
+            if self.conda_wsl is None:
+              self.conda_wsl = CondaSetUpCallWsl()  
             ready = True
             self.ui.timeLabel.setHidden(False)
-            self.ui.timeLabel.setText(f"Checking if wsl is installed, this task may take a moments")
-            slicer.app.processEvents()
+            # queued after the checks started in setup, only the ones that failed are done again
+            checks = self._env_executor.submit(self._checkWslEnv)
+            wsl, lib, conda, env = self._waitFuture(checks,"Checking if wsl, the required librairies and miniconda are installed, this task may take a moments")
             
             
             if wsl : # if wsl is install
-              lib = self.check_lib_wsl()
               if not lib : # if lib required are not install
                   self.ui.timeLabel.setText(f"Checking if the required librairies are installed, this task may take a moments")
                   messageBox = qt.QMessageBox()
@@ -787,7 +910,7 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
             
             if ready : # checking if miniconda installed on wsl
               self.ui.timeLabel.setText(f"Checking if miniconda is installed")
-              if "Error" in self.conda_wsl.condaRunCommand([self.conda_wsl.getCondaExecutable(),"--version"]): # if conda is setup
+              if not conda: # if conda is setup
                     messageBox = qt.QMessageBox()
                     text = "Code can't be launch. \nConda is not setup in WSL. Please go the extension CondaSetUp in SlicerConda to do it."
                     ready = False
@@ -795,27 +918,13 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
             
             if ready : # checking if environment 'shapeaxi' exist on wsl and if no ask user permission to create and install required lib in it
               self.ui.timeLabel.setText(f"Checking if environnement exist")     
-              if not self.conda_wsl.condaTestEnv('shapeaxi') : # check is environnement exist, if not ask user the permission to do it
+              if not env : # check is environnement exist, if not ask user the permission to do it
                 userResponse = slicer.util.confirmYesNoDisplay("The environnement to run the segmentation doesn't exist, do you want to create it ? ", windowTitle="Env doesn't exist")
                 if userResponse :
-                  start_time = time.time()
-                  previous_time = start_time
-                  self.ui.timeLabel.setText(f"Creation of the new environment. This task may take a few minutes.\ntime: 0.0s")
                   name_env = "shapeaxi"
-                  process = threading.Thread(target=self.conda_wsl.condaCreateEnv, args=(name_env,"3.9",["shapeaxi"],)) #run in paralle to not block slicer
-                  process.start()
-                  
-                  while process.is_alive():
-                    slicer.app.processEvents()
-                    current_time = time.time()
-                    gap=current_time-previous_time
-                    if gap>0.3:
-                        previous_time = current_time
-                        elapsed_time = current_time - start_time
-                        self.ui.timeLabel.setText(f"Creation of the new environment. This task may take a few minutes.\ntime: {elapsed_time:.1f}s")
+                  #run in paralle to not block slicer
+                  self._runThreadWithProgress(self.conda_wsl.condaCreateEnv,(name_env,"3.9",["shapeaxi"],),"Creation of the new environment. This task may take a few minutes.")
               
-                  start_time = time.time()
-                  previous_time = start_time
                   self.ui.timeLabel.setText(f"Installation of librairies into the new environnement. This task may take a few minutes.\ntime: 0.0s")
                   
                   name_env = "shapeaxi"
@@ -827,35 +936,20 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
                     result_pythonpath = self.check_pythonpath_windows(name_env,"CrownSegmentation_utils.install_pytorch")
                     
                   if result_pythonpath : 
-                    conda_exe = self.conda_wsl.getCondaExecutable()
-                    path_pip = self.conda_wsl.getCondaPath()+f"/envs/{name_env}/bin/pip"
+                    conda_exe = self._condaExecutable()
+                    path_pip = self._condaPath()+f"/envs/{name_env}/bin/pip"
                     # command = [conda_exe, "run", "-n", name_env, "python" ,"-m", f"ALI_IOS_utils.requirement",path_pip] # THIS LINE IS WORKING
                     command = [conda_exe, "run", "-n", name_env, "python" ,"-m", f"CrownSegmentation_utils.install_pytorch",path_pip]
-                    print("command : ",command)
+                    logger.debug("command : %s",command)
                   
-                    process = threading.Thread(target=self.conda_wsl.condaRunCommand, args=(command,)) # launch install_pythorch.py with the environnement ali_ios to install pytorch3d on it
-                    process.start()
-                    
-                    while process.is_alive():
-                      slicer.app.processEvents()
-                      current_time = time.time()
-                      gap=current_time-previous_time
-                      if gap>0.3:
-                          previous_time = current_time
-                          elapsed_time = current_time - start_time
-                          self.ui.timeLabel.setText(f"Installation of librairies into the new environnement. This task may take a few minutes.\ntime: {elapsed_time:.1f}s")
+                    # launch install_pythorch.py with the environnement ali_ios to install pytorch3d on it
+                    self._runThreadWithProgress(self.conda_wsl.condaRunCommand,(command,),"Installation of librairies into the new environnement. This task may take a few minutes.")
                           
                   ready = True
                 else :
                     ready = False
                     
             if ready : # if everything is ready launch dentalmodelseg on the environnement shapeaxi in wsl
-              model = self.model
-              if self.model == "latest":
-                model = None
-              else :
-                model = self.windows_to_linux_path(model)
-
               name_env = "shapeaxi"
 
               result_pythonpath = self.check_pythonpath_windows(name_env,"CrownSegmentationcli")
@@ -867,10 +961,20 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
                 # Creation path in wsl to dentalmodelseg
                 output_command = self.conda_wsl.condaRunCommand(["which","dentalmodelseg"],"shapeaxi").strip()
                 clean_output = re.search(r"Result: (.+)", output_command)
-                dentalmodelseg_path = clean_output.group(1).strip()
-                dentalmodelseg_path_clean = dentalmodelseg_path.replace("\\n","")
-                
-                
+                if clean_output is None : # the environment changed since it was checked
+                  logger.error("dentalmodelseg not found : %s",output_command)
+                  self.onRecheckEnvironment()
+                  messageBox = qt.QMessageBox()
+                  text = "Code can't be launch. \ndentalmodelseg was not found in the environment shapeaxi in WSL. The environment will be checked again, please run the segmentation again."
+                  messageBox.information(None, "Information", text)
+                  inputs = None
+                else :
+                  dentalmodelseg_path = clean_output.group(1).strip()
+                  dentalmodelseg_path_clean = dentalmodelseg_path.replace("\\n","")
+                  inputs = self._waitInputs(inputs_future)
+
+              if result_pythonpath and inputs is not None :
+                surf, input_csv, vtk_folder = inputs
                 args = [surf,
                         input_csv,
                         self.ui.outputLineEdit.text,
@@ -883,71 +987,127 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
                         vtk_folder,
                         dentalmodelseg_path_clean]
                 
-                conda_exe = self.conda_wsl.getCondaExecutable()
+                conda_exe = self._condaExecutable()
                 command = [conda_exe, "run", "-n", name_env, "python" ,"-m", f"CrownSegmentationcli"]
-                for arg in args :
-                      command.append("\""+arg+"\"")
-                print("command : ",command)
+                # condaRunCommand joins the command for bash in wsl, quote each argument for it
+                command += [shlex.quote(arg) for arg in args]
+                logger.debug("command : %s",command)
 
+                self.setUiState('running')
                 # running in // to not block Slicer
-                process = threading.Thread(target=self.conda_wsl.condaRunCommand, args=(command,))
-                process.start()
-                self.ui.applyChangesButton.setEnabled(False)
-                self.ui.doneLabel.setHidden(True)
-                self.ui.timeLabel.setHidden(False)
-                self.ui.progressLabel.setHidden(False)
-                self.ui.timeLabel.setText(f"time : 0.00s")
-                start_time = time.time()
-                previous_time = start_time
-                while process.is_alive():
-                    slicer.app.processEvents()
-                    current_time = time.time()
-                    gap=current_time-previous_time
-                    if gap>0.3:
-                        previous_time = current_time
-                        elapsed_time = current_time - start_time
-                        self.ui.timeLabel.setText(f"time : {elapsed_time:.2f}s")
-
-              
-              self.ui.progressLabel.setHidden(True)
-              self.ui.doneLabel.setHidden(False)
-              self.ui.applyChangesButton.setEnabled(True)
+                self._runThreadWithProgress(self.conda_wsl.condaRunCommand,(command,))
+                self.setUiState('done')
+              else :
+                self.setUiState('stopped')
 
-              # Delete csv file
-              file_path = os.path.abspath(__file__)
-              folder_path = os.path.dirname(file_path)
-              csv_file = os.path.join(folder_path,"list_file.csv")
-              if os.path.exists(csv_file):
-                os.remove(csv_file)
+        if not cli_running :
+          # the run is over or did not start, nothing reads the input files anymore
+          self._discardInputs(inputs_future)
 
     self.ui.applyChangesButton.setEnabled(True)
+    self.ui.recheckEnvironmentButton.setEnabled(True)
     
     
   def parall_process(self,function,arguments=[],message=""):
-        process = threading.Thread(target=function, args=tuple(arguments)) #run in paralle to not block slicer
+        self._runThreadWithProgress(function,tuple(arguments),message) #run in paralle to not block slicer
+
+  def _runThreadWithProgress(self,target,args=(),message=""):
+      '''
+      Run target(*args) in a thread and wait for it without blocking Slicer.
+      '''
+      process = None
+
+      def start(notify):
+        nonlocal process
+
+        def run():
+          try:
+            target(*args)
+          finally:
+            notify()
+
+        process = threading.Thread(target=run)
         process.start()
-        start_time = time.time()
-        previous_time = time.time()
-        while process.is_alive():
-          slicer.app.processEvents()
-          current_time = time.time()
-          gap=current_time-previous_time
-          if gap>0.3:
-              previous_time = current_time
-              elapsed_time = current_time - start_time
-              self.ui.timeLabel.setText(f"{message}\ntime: {elapsed_time:.1f}s")
+
+      self._waitWithProgress(start,message)
+      process.join()
+
+  def _waitFuture(self,future,message=""):
+      '''
+      Wait for a future of self._io_executor without blocking Slicer and return its result.
+      '''
+      if not future.done():
+        self._waitFutures([future],message)
+      return future.result()
+
+  def _waitFutures(self,futures,message=""):
+      '''
+      Wait until all the futures are done without blocking Slicer.
+      '''
+      def start(notify):
+        def onDone(_):
+          if all(future.done() for future in futures):
+            notify()
+
+        for future in futures:
+          future.add_done_callback(onDone)
+
+      self._waitWithProgress(start,message)
+
+  def _waitWithProgress(self,start,message=""):
+      '''
+      Run a Qt event loop until the work launched by start(notify) calls notify(), from any thread.
+      notify() writes a byte to a socket pair and a QSocketNotifier on the other end stops the loop,
+      so nothing polls the work. A QTimer only refreshes the elapsed time in timeLabel every 300ms.
+      The label is set to 0 right away so callers don't have to.
+      '''
+      # socketpair and not os.pipe: QSocketNotifier only supports sockets on Windows
+      done_r, done_w = socket.socketpair()
+      loop = qt.QEventLoop()
+      notifier = qt.QSocketNotifier(done_r.fileno(), qt.QSocketNotifier.Read)
+      notifier.activated.connect(lambda *args: loop.quit())
+      timer = qt.QTimer()
+      timer.setInterval(300)
+      elapsed_timer = qt.QElapsedTimer()
+      elapsed_timer.start()
+
+      def onTimeout():
+        elapsed_time = elapsed_timer.elapsed()/1000.0
+        if message:
+          self.ui.timeLabel.setText(f"{message}\ntime: {elapsed_time:.1f}s")
+        else:
+          self.ui.timeLabel.setText(f"time : {elapsed_time:.2f}s")
+
+      def notify():
+        try:
+          done_w.send(b'x')
+        except OSError: # already closed, an earlier call stopped the loop
+          pass
+
+      timer.timeout.connect(onTimeout)
+      onTimeout()
+      timer.start()
+      start(notify)
+      try:
+        loop.exec_()
+      finally:
+        timer.stop()
+        notifier.setEnabled(False)
+        done_r.close()
+        done_w.close()
           
-  def windows_to_linux_path(self,windows_path):
+  @staticmethod
+  def windows_to_linux_path(windows_path):
       '''
       Convert a windows path to a wsl path
       '''
-      windows_path = windows_path.strip()
-
-      path = windows_path.replace('\\', '/')
+      path = windows_path.strip()
+      if '\\' not in path and path[1:2] != ':': # already a posix path
+          return path
 
-      if ':' in path:
-          drive, path_without_drive = path.split(':', 1)
-          path = "/mnt/" + drive.lower() + path_without_drive
+      path = path.translate(_WIN2LIN_TABLE)
+      if path[1:2] == ':':
+          path = "/mnt/" + path[0].lower() + path[2:]
 
       return path
               
@@ -955,143 +1115,175 @@ class CrownSegmentationWidget(ScriptedLoadableModuleWidget, VTKObservationMixin)
       '''
       Check if wsl contains the require librairies
       '''
-      result1 = subprocess.run("wsl -- bash -c \"dpkg -l | grep libxrender1\"", capture_output=True, text=True)
-      output1 = result1.stdout.encode('utf-16-le').decode('utf-8')
-      clean_output1 = output1.replace('\x00', '')
+      if self._libs_ok:
+        return True
+      import subprocess
+      # one wsl call for all the packages, dpkg -l only lists the ones it knows
+      result = subprocess.run(f"wsl -- bash -c \"dpkg -l {' '.join(_WSL_REQUIRED_LIBS)} 2>/dev/null\"", capture_output=True, text=True, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)) # no console flash on windows
+      installed = set(_DPKG_INSTALLED_RE.findall(result.stdout))
 
-      result2 = subprocess.run("wsl -- bash -c \"dpkg -l | grep libgl1-mesa-glx\"", capture_output=True, text=True)
-      output2 = result2.stdout.encode('utf-16-le').decode('utf-8')
-      clean_output2 = output2.replace('\x00', '')
+      self._libs_ok = installed.issuperset(_WSL_REQUIRED_LIBS)
+      return self._libs_ok
 
-      return "libxrender1" in clean_output1 and "libgl1-mesa-glx" in clean_output2
 
 
+  def prepareInputs(self,in_file,in_dir):
+    '''
+    Start building the surf, input_csv and vtk_folder parameters of the CLI, writing the files it needs, and return a future of them.
+    The csv of a folder is written in self._io_executor while the environment is checked,
+    the MRML node is written here as its polydata belongs to the main thread.
+    '''
+    if in_dir:
+      input_folder = self.input
+      return self._io_executor.submit(lambda: ("None", self.create_csv(), input_folder))
+
+    future = concurrent.futures.Future()
+    try:
+      surf = "None"
+      if in_file:
+        if self.input.endswith(_EXTS):
+          surf = self.input
+
+      elif self.inputChoice is InputChoice.MRML_NODE:
+        surf = self.writeVTKFromNode()
+
+      future.set_result((surf, "None", "None"))
+    except Exception as error:
+      future.set_exception(error)
+    return future
+
+  def _waitInputs(self,future):
+    '''
+    Wait for prepareInputs and return its result, or show the error and return None if it failed.
+    '''
+    try:
+      return self._waitFuture(future,"Preparing the input files")
+    except Exception as error:
+      logger.error('Preparation of the input files failed : %s',error)
+      self.ui.timeLabel.setHidden(True)
+      msg = qt.QMessageBox()
+      msg.setText(f'The input files could not be prepared:\n \n {error} ')
+      msg.setWindowTitle("Error")
+      msg.exec_()
+      return None
+
+  def _discardInputs(self,future):
+    '''
+    Remove the input files of prepareInputs once it is done writing them, when no CLI uses them.
+    '''
+    if not future.cancel():
+      try:
+        self._waitFuture(future)
+      except Exception: # already reported by _waitInputs, or nobody waits for these files
+        pass
+    self.removeTempFiles()
 
   def create_csv(self):
     '''
     create a csv with the complete path of the files in the folder
     '''
-    file_path = os.path.abspath(__file__)
-    folder_path = os.path.dirname(file_path)
-    csv_file = os.path.join(folder_path,"list_file.csv")
-    with open(csv_file, 'w', newline='') as fichier:
-        writer = csv.writer(fichier)
+    csv_file = self.list_file_csv
+    # Parcourir le dossier et ses sous-dossiers
+    paths = list(walk_fast(self.input,_EXTS))
+
+    if platform.system() == "Windows" :
+      conv = self.windows_to_linux_path
+      normpath = os.path.normpath
+      paths = [conv(normpath(path)) for path in paths]
+
+    with open(csv_file, 'w', newline='', buffering=1<<20) as fichier:
+      if any(c in path for path in paths for c in _CSV_SPECIAL_CHARS):
+        # some paths must be quoted, let csv do it
+        import csv
+        writer = csv.writer(fichier, lineterminator='\n')
         # Écrire l'en-tête du CSV
         writer.writerow(["surf"])
-
-        # Parcourir le dossier et ses sous-dossiers
-        for root, dirs, files in os.walk(self.input):
-            for file in files:
-                if file.endswith(".vtk") or file.endswith(".stl"):
-                    # Écrire le chemin complet du fichier dans le CSV
-                    if platform.system() != "Windows" :    
-                      writer.writerow([os.path.join(root, file)])
-                    else :
-                      file_path = os.path.join(root, file)
-                      norm_file_path = os.path.normpath(file_path)
-                      writer.writerow([self.windows_to_linux_path(norm_file_path)])
-
+        # Écrire le chemin complet des fichiers dans le CSV
+        writer.writerows([path] for path in paths)
+      else:
+        fichier.write("surf\n" + "".join(path + "\n" for path in paths))
 
     return csv_file
 
 
-  def is_ubuntu_installed(self)->bool:
-      '''
-      Check if wsl is install with Ubuntu
-      '''
-      result = subprocess.run(['wsl', '--list'], capture_output=True, text=True)
-      output = result.stdout.encode('utf-16-le').decode('utf-8')
-      clean_output = output.replace('\x00', '')  # Enlève tous les octets null
-
-      return 'Ubuntu' in clean_output
-
   def onProcessStarted(self):
-    self.start_time = time.time()
-    self.previous_time = self.start_time  
+    self.elapsed_timer.start()
     
-    self.ui.applyChangesButton.setEnabled(False)
-    self.ui.doneLabel.setHidden(True)
-    self.ui.timeLabel.setHidden(False)
-    self.ui.progressLabel.setHidden(False)
+    self.setUiState('running')
     self.ui.timeLabel.setText(f"time : 0.00s") 
-     
+    self._label_timer.start()
 
 
-
-  def onProcessUpdate(self,caller,event):
-    # check log file
-    current_time = time.time()
-    gap = current_time - self.previous_time
-    if gap > 0.3:
-        self.previous_time = current_time
-        elapsed_time = current_time - self.start_time
-        self.ui.timeLabel.setText(f"Segmentation in process\ntime : {elapsed_time:.2f}s")
-    
+  def _tickLabel(self):
+    self.ui.timeLabel.setText(f"Segmentation in process\ntime : {self.elapsed_timer.elapsed()/1000.0:.2f}s")
 
 
+  def onProcessUpdate(self,caller,event):
     if self.logic.cliNode.GetStatus() & self.logic.cliNode.Completed:
       # process complete
-      self.ui.applyChangesButton.setEnabled(True)
-      self.ui.resetButton.setEnabled(True)
-      self.ui.progressLabel.setHidden(False)         
-      self.ui.cancelButton.setEnabled(False)
-      self.ui.progressBar.setEnabled(False)
-      self.ui.progressBar.setHidden(True)
-      self.ui.progressLabel.setHidden(True)
-
+      self._label_timer.stop()
       if self.logic.cliNode.GetStatus() & self.logic.cliNode.ErrorsMask:
         # error
+        self.setUiState('stopped')
         errorText = self.logic.cliNode.GetErrorText()
         print("CLI execution failed: \n \n" + errorText)
         msg = qt.QMessageBox()
         msg.setText(f'There was an error during the process:\n \n {errorText} ')
         msg.setWindowTitle("Error")
         msg.exec_()
+        self.removeTempFiles()
 
       else:
         # success
         print('PROCESS DONE.')
 
-        self.ui.progressLabel.setHidden(True)
-        self.ui.doneLabel.setHidden(False)
-        self.ui.applyChangesButton.setEnabled(True)
+        self.setUiState('done')
         print("Process completed successfully.")
-        self.ui.timeLabel.setText(f"time : {elapsed_time:.2f}s")
+        self.ui.timeLabel.setText(f"time : {self.elapsed_timer.elapsed()/1000.0:.2f}s")
 
           
         print("*"*25,"Output cli","*"*25)
         print(self.logic.cliNode.GetOutputText())
         
-        file_path = os.path.abspath(__file__)
-        folder_path = os.path.dirname(file_path)
-        csv_file = os.path.join(folder_path,"list_file.csv")
-        if os.path.exists(csv_file):
-          os.remove(csv_file)
+        self.removeTempFiles()
         
+  def removeTempFiles(self):
+    '''
+    Delete list_file.csv and the other intermediate files of the run
+    '''
+    Path(self.list_file_csv).unlink(missing_ok=True)
+    while self._temp_files:
+      Path(self._temp_files.pop()).unlink(missing_ok=True)
+
+  def setUiState(self,stage):
+    '''
+    Apply the visibility and enabled state of the widgets for stage ('idle', 'running', 'stopped' or 'done')
+    '''
+    for widget, (visible, enabled) in self._ui_states[stage].items():
+      if visible is not None:
+        widget.setHidden(not visible)
+      if enabled is not None:
+        widget.setEnabled(enabled)
+
   def onReset(self):
     self.ui.outputLineEdit.setText("")
     self.ui.surfaceLineEdit.setText("")
     self.ui.rotationSpinBox.value = 45
-    self.ui.applyChangesButton.setEnabled(True)
-    self.ui.progressLabel.setHidden(True)
-    self.ui.openOutSurfButton.setHidden(True)
-    self.ui.openOutFolderButton.setHidden(True)
+    self.setUiState('idle')
     self.ui.progressBar.setValue(0)
-    self.ui.doneLabel.setHidden(True)
     self.ui.surfaceComboBox.setCurrentIndex(0)
     self.ui.labelComboBox.setCurrentIndex(0)
     self.ui.sepOutputsCheckbox.setChecked(False)
+    self._label_timer.stop()
     self.removeObservers()    
 
   def onCancel(self):
     self.logic.cliNode.Cancel()
-    self.ui.applyChangesButton.setEnabled(True)
-    self.ui.resetButton.setEnabled(True)
-    self.ui.progressBar.setEnabled(False)
+    self._label_timer.stop()
+    self.setUiState('stopped')
     self.ui.progressBar.setRange(0,100)
-    self.ui.progressLabel.setHidden(True)
-    self.ui.cancelButton.setEnabled(False)
     self.removeObservers()    
+    self.removeTempFiles()
     print("Process successfully cancelled.")
 
 
@@ -1154,7 +1346,7 @@ class CrownSegmentationLogic(ScriptedLoadableModuleLogic):
     parameters ['suffix'] = self.suffix
     parameters ['vtk_folder'] = self.vtk_folder
     parameters ['dentalmodelseg_path'] = self.dentalmodelseg_path
-    print ('parameters : ', parameters)
+    logger.debug('parameters : %s', parameters)
     flybyProcess = slicer.modules.crownsegmentationcli
     self.cliNode = slicer.cli.run(flybyProcess,None, parameters)    
     return flybyProcess
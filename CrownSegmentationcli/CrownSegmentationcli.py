@@ -9,6 +9,7 @@ import platform
 import subprocess
 from pathlib import Path
 
+_WIN2LIN_TABLE = str.maketrans({'\\': '/'}) # used by windows_to_linux_path
 
 def check_environment_wsl():
       '''
@@ -33,21 +34,7 @@ def main(args):
     if platform.system()=="Linux" and not check_environment_wsl():
       print("_"*25,"RUN_IN_LINUX","_"*25)
       
-      command = [args.dentalmodelseg_path, "--out",args.out, "--overwrite", args.overwrite, "--crown_segmentation", args.crown_segmentation, "--array_name", args.array_name, "--fdi", args.fdi, "--suffix", args.suffix]
-      print("command : ",command)
-      if args.surf != "None":
-            command.append("--surf")
-            command.append(args.surf)
-      if args.input_csv != "None":
-            command.append("--csv")
-            command.append(args.input_csv)
-      if args.model!="latest":
-            command.append("--model")
-            command.append(args.model)
-      if args.vtk_folder!="None":
-            command.append("--vtk_folder")
-            command.append(args.vtk_folder)
-            
+      command = dentalmodelseg_command(args)
       print("command : ",command)
       
       result = subprocess.run(command,stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
@@ -61,35 +48,38 @@ def main(args):
       print("_"*25,"RUN_IN_WSL","_"*25)
 
       
-      command = [args.dentalmodelseg_path, "--out",windows_to_linux_path(args.out), "--overwrite", args.overwrite, "--crown_segmentation", args.crown_segmentation, "--array_name", args.array_name, "--fdi", args.fdi, "--suffix", args.suffix]
+      command = dentalmodelseg_command(args,windows_to_linux_path)
+      print("command : ",command)
+      subprocess.run(command)
+
+
+def dentalmodelseg_command(args,convert_path=None):
+      '''
+      Build the argument list of dentalmodelseg, it is run directly without a shell.
+      convert_path is applied to every path argument (ex : windows_to_linux_path)
+      '''
+      if convert_path is None:
+            convert_path = lambda path : path
+
+      command = [args.dentalmodelseg_path, "--out",convert_path(args.out), "--overwrite", args.overwrite, "--crown_segmentation", args.crown_segmentation, "--array_name", args.array_name, "--fdi", args.fdi, "--suffix", args.suffix]
       if args.surf != "None":
-            command.append("--surf")
-            command.append(windows_to_linux_path(args.surf))
+            command += ["--surf",convert_path(args.surf)]
       if args.input_csv != "None":
-            command.append("--csv")
-            command.append(windows_to_linux_path(args.input_csv))
+            command += ["--csv",convert_path(args.input_csv)]
       if args.model!="latest":
-            command.append("--model")
-            command.append(windows_to_linux_path(args.model))
+            command += ["--model",convert_path(args.model)]
       if args.vtk_folder!="None":
-            command.append("--vtk_folder")
-            command.append(windows_to_linux_path(args.vtk_folder))
-      
-      print("command : ",command)
-      subprocess.run(command)
+            command += ["--vtk_folder",convert_path(args.vtk_folder)]
+      return command
 
 
 def windows_to_linux_path(windows_path):
       '''
       Convert a windows path to a wsl path
       '''
-      windows_path = windows_path.strip()
-
-      path = windows_path.replace('\\', '/')
-
-      if ':' in path:
-          drive, path_without_drive = path.split(':', 1)
-          path = "/mnt/" + drive.lower() + path_without_drive
+      path = windows_path.strip().translate(_WIN2LIN_TABLE)
+      if path[1:2] == ':':
+          path = "/mnt/" + path[0].lower() + path[2:]
 
       return path
 